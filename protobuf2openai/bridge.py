@@ -20,6 +20,10 @@ from .packets import packet_template
 from .state import STATE, ensure_tool_ids
 
 
+# Shared session so bridge calls reuse pooled keep-alive connections
+BRIDGE_SESSION = requests.Session()
+
+
 def bridge_send_stream(packet: Dict[str, Any]) -> Dict[str, Any]:
     last_exc: Optional[Exception] = None
     for base in FALLBACK_BRIDGE_URLS:
@@ -31,7 +35,7 @@ def bridge_send_stream(packet: Dict[str, Any]) -> Dict[str, Any]:
                 logger.info("[OpenAI Compat] Bridge request payload: %s", json.dumps(wrapped_packet, ensure_ascii=False))
             except Exception:
                 logger.info("[OpenAI Compat] Bridge request payload serialization failed for URL %s", url)
-            r = requests.post(url, json=wrapped_packet, timeout=(5.0, 180.0))
+            r = BRIDGE_SESSION.post(url, json=wrapped_packet, timeout=(5.0, 180.0))
             if r.status_code == 200:
                 try:
                     logger.info("[OpenAI Compat] Bridge response (raw text): %s", r.text)
@@ -66,7 +70,7 @@ def initialize_once() -> None:
             last_err = None
             for h in health_urls:
                 try:
-                    resp = requests.get(h, timeout=5.0)
+                    resp = BRIDGE_SESSION.get(h, timeout=5.0)
                     if resp.status_code == 200:
                         ok = True
                         break
@@ -18,7 +18,7 @@ from .helpers import normalize_content_to_list, segments_to_text
 from .packets import packet_template, map_history_to_warp_messages, attach_user_and_tools_to_inputs
 from .state import STATE
 from .config import BRIDGE_BASE_URL
-from .bridge import initialize_once
+from .bridge import BRIDGE_SESSION, initialize_once
 from .sse_transform import stream_openai_sse
 from .auth import authenticate_request
 
@@ -40,7 +40,7 @@ def health_check():
 def list_models():
     """OpenAI-compatible model listing. Forwards to bridge, with local fallback."""
     try:
-        resp = requests.get(f"{BRIDGE_BASE_URL}/v1/models", timeout=10.0)
+        resp = BRIDGE_SESSION.get(f"{BRIDGE_BASE_URL}/v1/models", timeout=10.0)
         if resp.status_code != 200:
             raise HTTPException(resp.status_code, f"bridge_error: {resp.text}")
         return resp.json()
@@ -149,7 +149,7 @@ async def chat_completions(req: ChatCompletionsRequest, request: Request = None)
         return StreamingResponse(_agen(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "Connection": "keep-alive"})
 
     def _post_once() -> requests.Response:
-        return requests.post(
+        return BRIDGE_SESSION.post(
             f"{BRIDGE_BASE_URL}/api/warp/send_stream",
             json={"json_data": packet, "message_type": "warp.multi_agent.v1.Request"},
             timeout=(5.0, 180.0),
@@ -159,7 +159,7 @@ async def chat_completions(req: ChatCompletionsRequest, request: Request = None)
         resp = _post_once()
         if resp.status_code == 429:
             try:
-                r = requests.post(f"{BRIDGE_BASE_URL}/api/auth/refresh", timeout=10.0)
+                r = BRIDGE_SESSION.post(f"{BRIDGE_BASE_URL}/api/auth/refresh", timeout=10.0)
                 logger.warning("[OpenAI Compat] Bridge returned 429. Tried JWT refresh -> HTTP %s", getattr(r, 'status_code', 'N/A'))
             except Exception as _e:
                 logger.warning("[OpenAI Compat] JWT refresh attempt failed after 429: %s", _e)
@@ -26,6 +26,7 @@ from warp2protobuf.api.protobuf_routes import EncodeRequest, _encode_smd_inplace
 from warp2protobuf.core.protobuf_utils import dict_to_protobuf_bytes
 from warp2protobuf.core.schema_sanitizer import sanitize_mcp_input_schema_in_packet
 from warp2protobuf.core.auth import acquire_anonymous_access_token
+from warp2protobuf.warp.api_client import close_client as close_warp_client
 from warp2protobuf.config.models import get_all_unique_models
 
 
@@ -525,6 +526,10 @@ def main():
     @app.on_event("startup")
     async def startup_event():
         await startup_tasks()
+
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await close_warp_client()
     
     # 启动服务器
     try:
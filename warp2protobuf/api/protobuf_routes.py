@@ -26,6 +26,14 @@ from ..config.settings import CLIENT_VERSION, OS_CATEGORY, OS_NAME, OS_VERSION,
 from ..core.server_message_data import decode_server_message_data, encode_server_message_data
 
 
+def _get(d: Dict[str, Any], *names: str) -> Any:
+    """Return the first matching key value (camelCase/snake_case tolerant)."""
+    for n in names:
+        if isinstance(d, dict) and n in d:
+            return d[n]
+    return None
+
+
 def _encode_smd_inplace(obj: Any) -> Any:
     if isinstance(obj, dict):
         new_d = {}
@@ -553,11 +561,6 @@ async def send_to_warp_api_stream_sse(request: EncodeRequest):
                                     event_data = protobuf_to_dict(raw_bytes, "warp.multi_agent.v1.ResponseEvent")
                                 except Exception:
                                     continue
-                                def _get(d: Dict[str, Any], *names: str) -> Any:
-                                    for n in names:
-                                        if isinstance(d, dict) and n in d:
-                                            return d[n]
-                                    return None
                                 event_type = "UNKNOWN_EVENT"
                                 if isinstance(event_data, dict):
                                     if "init" in event_data:
@@ -24,6 +24,8 @@ WARP_URL = "https://app.warp.dev/ai/multi-agent"
 HOST = os.getenv("HOST", "0.0.0.0")
 PORT = int(os.getenv("PORT", "8002"))
 WARP_JWT = os.getenv("WARP_JWT")
+# Per-event SSE stream logging (event dumps, text fragments); off unless W2A_VERBOSE=true
+VERBOSE_LOGS = os.getenv("W2A_VERBOSE", "false").lower() == "true"
 
 # Client headers configuration
 CLIENT_VERSION = "v0.2025.08.06.08.12.stable_02"
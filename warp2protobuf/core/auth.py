@@ -7,13 +7,14 @@ Handles JWT token management, refresh, and validation.
 Integrates functionality from refresh_jwt.py.
 """
 import base64
+import functools
 import json
 import os
 import time
 from pathlib import Path
 import httpx
 import asyncio
-from dotenv import load_dotenv, set_key
+from dotenv import find_dotenv, load_dotenv, set_key
 
 from ..config.settings import REFRESH_TOKEN_B64, REFRESH_URL, CLIENT_VERSION, OS_CATEGORY, OS_NAME, OS_VERSION
 from .logging import logger, log
@@ -21,6 +22,14 @@ from .logging import logger, log
 
 def decode_jwt_payload(token: str) -> dict:
     """Decode JWT payload to check expiration"""
+    payload = _decode_jwt_payload_cached(token)
+    # Copy so callers can't mutate the cached value; non-object payloads count as undecodable
+    return dict(payload) if isinstance(payload, dict) else {}
+
+
+@functools.lru_cache(maxsize=8)
+def _decode_jwt_payload_cached(token: str) -> dict:
+    # The same token is checked on every request; cache to skip repeated base64 + JSON parsing
     try:
         parts = token.split('.')
         if len(parts) != 3:
@@ -94,6 +103,7 @@ def update_env_file(new_jwt: str) -> bool:
     env_path = Path(".env")
     try:
         set_key(str(env_path), "WARP_JWT", new_jwt)
+        invalidate_cached_jwt()
         logger.info("Updated .env file with new JWT token")
         return True
     except Exception as e:
@@ -170,6 +180,54 @@ async def get_valid_jwt() -> str:
     return jwt
 
 
+# Reuse the last get_valid_jwt result (which re-reads .env) until it nears expiry.
+# Dropped whenever this process writes a token; a changed WARP_JWT or .env mtime also bypasses it.
+_JWT_CACHE: dict = {"jwt": None, "exp": 0.0, "env_mtime": None}
+_JWT_CACHE_MARGIN = 120.0
+
+
+def _env_file_mtime():
+    # Same file get_valid_jwt's load_dotenv() resolves from this module
+    env_path = find_dotenv()
+    if not env_path:
+        return None
+    try:
+        return os.stat(env_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def invalidate_cached_jwt() -> None:
+    _JWT_CACHE["jwt"] = None
+    _JWT_CACHE["exp"] = 0.0
+    _JWT_CACHE["env_mtime"] = None
+
+
+async def get_cached_valid_jwt() -> str:
+    """Like get_valid_jwt, but skips the .env reload while the cached token is still current."""
+    jwt = _JWT_CACHE["jwt"]
+    if (
+        jwt
+        and jwt == os.getenv("WARP_JWT")
+        and _JWT_CACHE["env_mtime"] == _env_file_mtime()
+        and time.time() < _JWT_CACHE["exp"] - _JWT_CACHE_MARGIN
+    ):
+        return jwt
+    env_mtime = _env_file_mtime()
+    jwt = await get_valid_jwt()
+    exp = decode_jwt_payload(jwt).get("exp")
+    _JWT_CACHE["jwt"] = jwt
+    _JWT_CACHE["exp"] = float(exp) if isinstance(exp, (int, float)) else 0.0
+    _JWT_CACHE["env_mtime"] = env_mtime
+    return jwt
+
+
+def read_env_jwt() -> str:
+    """Return WARP_JWT as currently stored in .env, re-reading the file."""
+    load_dotenv(override=True)
+    return os.getenv("WARP_JWT", "")
+
+
 def get_jwt_token() -> str:
     from dotenv import load_dotenv as _load
     _load()
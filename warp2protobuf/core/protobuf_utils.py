@@ -5,6 +5,7 @@ Protobuf utility functions
 
 Shared functions for protobuf encoding/decoding across the application.
 """
+import functools
 from typing import Any, Dict
 from fastapi import HTTPException
 from .logging import logger
@@ -18,26 +19,44 @@ from .server_message_data import decode_server_message_data, encode_server_messa
 
 
 
+@functools.lru_cache(maxsize=None)
+def _message_class(message_type: str):
+    """按全名查找并缓存消息类，避免每次都查询描述符池"""
+    ensure_proto_runtime()
+    return msg_cls(message_type)
+
+
 def protobuf_to_dict(protobuf_bytes: bytes, message_type: str) -> Dict:
     """将protobuf字节转换为字典"""
-    ensure_proto_runtime()
-    
     try:
-        MessageClass = msg_cls(message_type)
-        message = MessageClass()
+        message = _message_class(message_type)()
         message.ParseFromString(protobuf_bytes)
         
-        data = MessageToDict(message, preserving_proto_field_name=True)
-        
-        # 在转换阶段自动解析 server_message_data（Base64URL -> 结构化对象）
-        data = _decode_smd_inplace(data)
-        return data
+        return message_to_dict(message)
     
     except Exception as e:
         logger.error(f"Protobuf解码失败: {e}")
         raise HTTPException(500, f"Protobuf解码失败: {e}")
 
 
+def message_to_dict(message: Any) -> Dict:
+    """将已解析的protobuf消息转换为字典（输出与 protobuf_to_dict 一致）"""
+    data = MessageToDict(message, preserving_proto_field_name=True)
+    
+    # 在转换阶段自动解析 server_message_data（Base64URL -> 结构化对象）
+    return _decode_smd_inplace(data)
+
+
+def parse_response_event(protobuf_bytes: bytes) -> Any:
+    """将SSE负载解析为 ResponseEvent 消息对象（不转换为字典）
+
+    供只读取少量字段的流式热路径使用；解析失败时直接抛出异常。
+    """
+    message = _message_class("warp.multi_agent.v1.ResponseEvent")()
+    message.ParseFromString(protobuf_bytes)
+    return message
+
+
 
 
 
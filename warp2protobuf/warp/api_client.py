@@ -6,65 +6,282 @@ Warp API客户端模块
 处理与Warp API的通信，包括protobuf数据发送和SSE响应解析。
 """
 import httpx
+import io
 import os
+import logging
 import base64
 import binascii
-from typing import Optional, Any, Dict
+import asyncio
+import random
+import traceback
+import email.utils
+from datetime import datetime, timezone
+from typing import Optional, Any, AsyncIterator, Dict
 from urllib.parse import urlparse
 import socket
 
 from ..core.logging import logger
-from ..core.protobuf_utils import protobuf_to_dict
-from ..core.auth import get_valid_jwt, acquire_anonymous_access_token
-from ..config.settings import WARP_URL as CONFIG_WARP_URL
+from ..core.protobuf_utils import message_to_dict, parse_response_event
+from ..core.auth import get_cached_valid_jwt, invalidate_cached_jwt, read_env_jwt, acquire_anonymous_access_token
+from ..config.settings import WARP_URL as CONFIG_WARP_URL, CLIENT_VERSION, OS_CATEGORY, OS_NAME, OS_VERSION, VERBOSE_LOGS
 
 
-def _get(d: Dict[str, Any], *names: str) -> Any:
-    """Return the first matching key value (camelCase/snake_case tolerant)."""
-    for name in names:
-        if name in d:
-            return d[name]
-    return None
+# Static request headers; only authorization and content-length vary per request
+_BASE_HEADERS: Dict[str, str] = {
+    "accept": "text/event-stream",
+    "content-type": "application/x-protobuf",
+    "x-warp-client-version": CLIENT_VERSION,
+    "x-warp-os-category": OS_CATEGORY,
+    "x-warp-os-name": OS_NAME,
+    "x-warp-os-version": OS_VERSION,
+}
+_AUTH_PREFIX = "Bearer "
 
+# Total attempts per request, including retries after a 429
+_MAX_ATTEMPTS = 3
 
-def _get_event_type(event_data: dict) -> str:
+# Concurrent quota 429s share a single anonymous-token acquisition
+_ANON_STATE: Dict[str, Any] = {"jwt": None, "refreshing": False}
+_ANON_COND = asyncio.Condition()
+
+_CLIENT: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    """Return the shared Warp API client, creating it on first use.
+
+    Reusing one client keeps the HTTP/2 connection pool warm so requests
+    skip the DNS/TCP/TLS handshake.
+    """
+    global _CLIENT
+    if _CLIENT is None or _CLIENT.is_closed:
+        verify_opt = True
+        insecure_env = os.getenv("WARP_INSECURE_TLS", "").lower()
+        if insecure_env in ("1", "true", "yes"):
+            verify_opt = False
+            logger.warning("TLS verification disabled via WARP_INSECURE_TLS for Warp API client")
+        _CLIENT = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32, keepalive_expiry=60.0),
+            verify=verify_opt,
+            trust_env=True,
+        )
+    return _CLIENT
+
+
+async def close_client() -> None:
+    """Close the shared Warp API client (called on server shutdown)."""
+    global _CLIENT
+    if _CLIENT is not None:
+        await _CLIENT.aclose()
+        _CLIENT = None
+
+
+async def _get_or_refresh_anon_token(rejected_jwt: str) -> Optional[str]:
+    """Return a fresh anonymous JWT after ``rejected_jwt`` hit the quota limit.
+
+    Only one caller acquires a token at a time; callers arriving while that is in
+    flight wait for it and reuse its result. If .env already holds a token other
+    than the rejected one, that token is returned without a new acquisition.
+    """
+    async with _ANON_COND:
+        if _ANON_STATE["refreshing"]:
+            await _ANON_COND.wait_for(lambda: not _ANON_STATE["refreshing"])
+            return _ANON_STATE["jwt"]
+        # .env may already hold a replacement written by another route or process
+        current = read_env_jwt()
+        if current and current != rejected_jwt:
+            return current
+        _ANON_STATE["refreshing"] = True
+    new_jwt = None
+    try:
+        new_jwt = await acquire_anonymous_access_token()
+    except Exception as e:
+        logger.warning(f"匿名token申请异常: {e}")
+    finally:
+        async with _ANON_COND:
+            _ANON_STATE["jwt"] = new_jwt or None
+            _ANON_STATE["refreshing"] = False
+            if not new_jwt:
+                invalidate_cached_jwt()
+            _ANON_COND.notify_all()
+    return new_jwt or None
+
+
+def _compute_retry_wait(
+    attempt: int, response: httpx.Response, *, base: float = 1.0, cap: float = 30.0, jitter: float = 0.5
+) -> float:
+    """Seconds to wait before retrying a rate-limited request.
+
+    Honors ``Retry-After`` (delta-seconds or HTTP-date) when present, otherwise uses
+    capped exponential backoff with jitter.
+    """
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(cap, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            when = None
+        if when is not None:
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            return min(cap, max(0.0, (when - datetime.now(timezone.utc)).total_seconds()))
+    return min(cap, base * (2 ** attempt)) * (1 + random.uniform(0, jitter))
+
+
+async def _sleep_backoff(attempt: int, response: httpx.Response) -> None:
+    delay = _compute_retry_wait(attempt, response)
+    logger.warning(f"WARP API 返回 429 (限流)，{delay:.2f}s 后重试 (第 {attempt + 1}/{_MAX_ATTEMPTS} 次尝试)")
+    await asyncio.sleep(delay)
+
+
+# ASCII whitespace removed from payloads before decoding (bytes.translate delete set)
+_WS_BYTES = b" \t\r\n\v\f"
+
+
+def _parse_payload_bytes(payload: bytes) -> Optional[bytes]:
+    """Decode an SSE data payload (hex or base64/base64url) into raw bytes."""
+    s = payload.translate(None, _WS_BYTES)
+    if not s:
+        return None
+    try:
+        return binascii.unhexlify(s)
+    except binascii.Error:
+        pass
+    pad = b"=" * ((4 - (len(s) % 4)) % 4)
+    try:
+        return base64.urlsafe_b64decode(s + pad)
+    except Exception:
+        try:
+            return base64.b64decode(s + pad)
+        except Exception:
+            return None
+
+
+async def _iter_sse_events(response: httpx.Response) -> AsyncIterator[bytes]:
+    """Yield the joined ``data:`` payload of each SSE event in a streaming response.
+
+    Lines are split on raw bytes and payloads are handed on undecoded, since they
+    are hex/base64 and never need a str round trip. LF, CRLF and bare CR all end
+    a line. Iteration stops at the ``[DONE]`` marker.
+    """
+    # Pieces of a line that has not been terminated yet; joined once, so a
+    # multi-MB line spread over many chunks stays linear
+    pending: list[bytes] = []
+    parts: list[bytes] = []
+    skip_lf = False
+    async for chunk in response.aiter_bytes():
+        if skip_lf and chunk:
+            # Previous chunk ended in CR; a leading LF completes that CRLF
+            skip_lf = False
+            if chunk[:1] == b"\n":
+                chunk = chunk[1:]
+        if b"\r" in chunk:
+            skip_lf = chunk.endswith(b"\r")
+            chunk = chunk.replace(b"\r\n", b"\n")
+            if b"\r" in chunk:
+                chunk = chunk.replace(b"\r", b"\n")
+        lines = chunk.split(b"\n")
+        if len(lines) == 1:
+            if chunk:
+                pending.append(chunk)
+            continue
+        if pending:
+            pending.append(lines[0])
+            lines[0] = b"".join(pending)
+            pending.clear()
+        tail = lines.pop()
+        if tail:
+            pending.append(tail)
+        for line in lines:
+            if not line:
+                if parts:
+                    yield b"".join(parts)
+                    parts.clear()
+                continue
+            # Split on the first colon as the SSE spec does; comments, event:, id: and retry: are ignored
+            field, _, value = line.partition(b":")
+            if field != b"data":
+                continue
+            if value.startswith(b" "):
+                value = value[1:]
+            if not value:
+                continue
+            if value.strip() == b"[DONE]":
+                logger.info("收到[DONE]标记，结束处理")
+                return
+            parts.append(value)
+
+
+# ClientAction oneof member -> event type label used in logs and recorded events
+_ACTION_TYPES = {
+    "create_task": "CREATE_TASK",
+    "append_to_message_content": "APPEND_CONTENT",
+    "add_messages_to_task": "ADD_MESSAGE",
+}
+
+
+def _get_event_type(event: Any) -> str:
     """Determine the type of SSE event for logging"""
-    if "init" in event_data:
+    kind = event.WhichOneof("type")
+    if kind == "init":
         return "INITIALIZATION"
-    client_actions = _get(event_data, "client_actions", "clientActions")
-    if isinstance(client_actions, dict):
-        actions = _get(client_actions, "actions", "Actions") or []
+    if kind == "client_actions":
+        actions = event.client_actions.actions
         if not actions:
             return "CLIENT_ACTIONS_EMPTY"
-        
-        action_types = []
-        for action in actions:
-            if _get(action, "create_task", "createTask") is not None:
-                action_types.append("CREATE_TASK")
-            elif _get(action, "append_to_message_content", "appendToMessageContent") is not None:
-                action_types.append("APPEND_CONTENT")
-            elif _get(action, "add_messages_to_task", "addMessagesToTask") is not None:
-                action_types.append("ADD_MESSAGE")
-            elif _get(action, "tool_call", "toolCall") is not None:
-                action_types.append("TOOL_CALL")
-            elif _get(action, "tool_response", "toolResponse") is not None:
-                action_types.append("TOOL_RESPONSE")
-            else:
-                action_types.append("UNKNOWN_ACTION")
-        
+        action_types = [_ACTION_TYPES.get(action.WhichOneof("action"), "UNKNOWN_ACTION") for action in actions]
         return f"CLIENT_ACTIONS({', '.join(action_types)})"
-    elif "finished" in event_data:
+    if kind == "finished":
         return "FINISHED"
-    else:
-        return "UNKNOWN_EVENT"
+    return "UNKNOWN_EVENT"
 
 
-async def send_protobuf_to_warp_api(
-    protobuf_bytes: bytes, show_all_events: bool = True
-) -> tuple[str, Optional[str], Optional[str]]:
-    """发送protobuf数据到Warp API并获取响应"""
+def _event_to_dict(event: Any) -> Optional[dict]:
+    """Convert a parsed event to a dict, or None if it can't be serialized."""
+    try:
+        return message_to_dict(event)
+    except Exception as convert_error:
+        # 文本仍从消息对象读取；仅该事件的记录/日志不含数据
+        logger.debug(f"事件转换为字典失败，记录时不含数据: {str(convert_error)[:100]}")
+        return None
+
+
+# SSE stream summary, emitted as one multi-line log record
+_SUMMARY_RULE = "=" * 60
+_SUMMARY_BODY = (
+    "📈 Total Events Processed: %d\n"
+    "🆔 Conversation ID: %s\n"
+    "🆔 Task ID: %s\n"
+    "📝 Response Length: %d characters\n"
+)
+_SUMMARY_TMPL = (
+    f"\n{_SUMMARY_RULE}\n📊 SSE STREAM SUMMARY\n{_SUMMARY_RULE}\n"
+    f"{_SUMMARY_BODY}{_SUMMARY_RULE}"
+)
+_SUMMARY_TMPL_PARSED = (
+    f"\n{_SUMMARY_RULE}\n📊 SSE STREAM SUMMARY (解析模式)\n{_SUMMARY_RULE}\n"
+    f"{_SUMMARY_BODY}🎯 Parsed Events Count: %d\n{_SUMMARY_RULE}"
+)
+
+
+async def _stream_warp(
+    protobuf_bytes: bytes, *, show_all_events: bool, collect_parsed: bool
+) -> tuple[str, Optional[str], Optional[str], list]:
+    """发送protobuf数据到Warp API并消费SSE事件流（两个公开接口共用）
+
+    Returns (text, conversation_id, task_id, events). ``events`` holds one record per
+    event in ``collect_parsed`` mode and stays empty otherwise; ``show_all_events``
+    only controls whether each event is dumped to the log.
+    """
+    mode = " (解析模式)" if collect_parsed else ""
     try:
-        logger.info(f"发送 {len(protobuf_bytes)} 字节到Warp API")
+        logger.info(f"发送 {len(protobuf_bytes)} 字节到Warp API{mode}")
         logger.info(f"数据包前32字节 (hex): {protobuf_bytes[:32].hex()}")
         
         warp_url = CONFIG_WARP_URL
@@ -73,167 +290,129 @@ async def send_protobuf_to_warp_api(
         
         conversation_id = None
         task_id = None
-        complete_response = []
-        all_events = []
+        complete_response = io.StringIO()
+        events = []
         event_count = 0
         
-        verify_opt = True
-        insecure_env = os.getenv("WARP_INSECURE_TLS", "").lower()
-        if insecure_env in ("1", "true", "yes"):
-            verify_opt = False
-            logger.warning("TLS verification disabled via WARP_INSECURE_TLS for Warp API client")
-
-        async with httpx.AsyncClient(http2=True, timeout=httpx.Timeout(60.0), verify=verify_opt, trust_env=True) as client:
-            # 最多尝试两次：第一次失败且为配额429时申请匿名token并重试一次
-            for attempt in range(2):
-                jwt = await get_valid_jwt() if attempt == 0 else jwt  # keep existing unless refreshed explicitly
-                headers = {
-                    "accept": "text/event-stream",
-                    "content-type": "application/x-protobuf", 
-                    "x-warp-client-version": "v0.2025.08.06.08.12.stable_02",
-                    "x-warp-os-category": "Windows",
-                    "x-warp-os-name": "Windows", 
-                    "x-warp-os-version": "11 (26100)",
-                    "authorization": f"Bearer {jwt}",
-                    "content-length": str(len(protobuf_bytes)),
-                }
-                async with client.stream("POST", warp_url, headers=headers, content=protobuf_bytes) as response:
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        error_content = error_text.decode('utf-8') if error_text else "No error content"
-                        # 检测配额耗尽错误并在第一次失败时尝试申请匿名token
-                        if response.status_code == 429 and attempt == 0 and (
-                            ("No remaining quota" in error_content) or ("No AI requests remaining" in error_content)
-                        ):
-                            logger.warning("WARP API 返回 429 (配额用尽)。尝试申请匿名token并重试一次…")
-                            try:
-                                new_jwt = await acquire_anonymous_access_token()
-                            except Exception:
-                                new_jwt = None
-                            if new_jwt:
-                                jwt = new_jwt
-                                # 跳出当前响应并进行下一次尝试
-                                continue
-                            else:
-                                logger.error("匿名token申请失败，无法重试。")
-                                logger.error(f"WARP API HTTP ERROR {response.status_code}: {error_content}")
-                                return f"❌ Warp API Error (HTTP {response.status_code}): {error_content}", None, None
-                        # 其他错误或第二次失败
-                        logger.error(f"WARP API HTTP ERROR {response.status_code}: {error_content}")
-                        return f"❌ Warp API Error (HTTP {response.status_code}): {error_content}", None, None
-                    
-                    logger.info(f"✅ 收到HTTP {response.status_code}响应")
-                    logger.info("开始处理SSE事件流...")
-                    
-                    import re as _re
-                    def _parse_payload_bytes(data_str: str):
-                        s = _re.sub(r"\s+", "", data_str or "")
-                        if not s:
-                            return None
-                        if _re.fullmatch(r"[0-9a-fA-F]+", s or ""):
-                            try:
-                                return bytes.fromhex(s)
-                            except Exception:
-                                pass
-                        pad = "=" * ((4 - (len(s) % 4)) % 4)
-                        try:
-                            import base64 as _b64
-                            return _b64.urlsafe_b64decode(s + pad)
-                        except Exception:
-                            try:
-                                return _b64.b64decode(s + pad)
-                            except Exception:
-                                return None
+        client = _get_client()
+        content_length = str(len(protobuf_bytes))
+        anon_tried = False
+        # 配额429时申请一次匿名token后立即重试；其他429按退避策略等待后重试
+        for attempt in range(_MAX_ATTEMPTS):
+            jwt = await get_cached_valid_jwt() if attempt == 0 else jwt  # keep existing unless refreshed explicitly
+            headers = {
+                **_BASE_HEADERS,
+                "authorization": _AUTH_PREFIX + jwt,
+                "content-length": content_length,
+            }
+            async with client.stream("POST", warp_url, headers=headers, content=protobuf_bytes) as response:
+                if response.status_code != 200:
+                    error_text = await response.aread()
+                    error_content = error_text.decode('utf-8') if error_text else "No error content"
+                    if response.status_code in (401, 403):
+                        # 令牌被拒绝，下次请求重新获取
+                        invalidate_cached_jwt()
+                    can_retry = response.status_code == 429 and attempt + 1 < _MAX_ATTEMPTS
+                    quota_exhausted = ("No remaining quota" in error_content) or ("No AI requests remaining" in error_content)
+                    # 检测配额耗尽错误并尝试申请一次匿名token
+                    if can_retry and quota_exhausted and not anon_tried:
+                        anon_tried = True
+                        logger.warning(f"WARP API 返回 429 (配额用尽{mode})。尝试申请匿名token并重试一次…")
+                        new_jwt = await _get_or_refresh_anon_token(jwt)
+                        if new_jwt:
+                            jwt = new_jwt
+                            # 跳出当前响应并进行下一次尝试
+                            continue
+                        else:
+                            logger.error(f"匿名token申请失败，无法重试{mode}。")
+                            logger.error(f"WARP API HTTP ERROR{mode} {response.status_code}: {error_content}")
+                            return f"❌ Warp API Error (HTTP {response.status_code}): {error_content}", None, None, []
+                    if can_retry and not quota_exhausted:
+                        await _sleep_backoff(attempt, response)
+                        continue
+                    # 其他错误或重试次数用尽
+                    logger.error(f"WARP API HTTP ERROR{mode} {response.status_code}: {error_content}")
+                    return f"❌ Warp API Error (HTTP {response.status_code}): {error_content}", None, None, []
                     
-                    current_data = ""
+                logger.info(f"✅ 收到HTTP {response.status_code}响应{mode}")
+                logger.info("开始处理SSE事件流...")
+                # logger 固定为 DEBUG 级别，逐事件日志需显式开启 W2A_VERBOSE
+                verbose = VERBOSE_LOGS and logger.isEnabledFor(logging.DEBUG)
+                # 绑定为局部变量，省去循环内的属性/全局查找
+                append_event = events.append
+                write_text = complete_response.write
+                get_event_type = _get_event_type
                     
-                    async for line in response.aiter_lines():
-                        if line.startswith("data:"):
-                            payload = line[5:].strip()
-                            if not payload:
-                                continue
-                            if payload == "[DONE]":
-                                logger.info("收到[DONE]标记，结束处理")
-                                break
-                            current_data += payload
-                            continue
-                        
-                        if (line.strip() == "") and current_data:
-                            raw_bytes = _parse_payload_bytes(current_data)
-                            current_data = ""
-                            if raw_bytes is None:
-                                logger.debug("跳过无法解析的SSE数据块（非hex/base64或不完整）")
-                                continue
-                            try:
-                                event_data = protobuf_to_dict(raw_bytes, "warp.multi_agent.v1.ResponseEvent")
-                            except Exception as parse_error:
-                                logger.debug(f"解析事件失败，跳过: {str(parse_error)[:100]}")
-                                continue
-                            event_count += 1
-                            
-                            def _get(d: Dict[str, Any], *names: str) -> Any:
-                                for n in names:
-                                    if isinstance(d, dict) and n in d:
-                                        return d[n]
-                                return None
+                async for payload in _iter_sse_events(response):
+                    raw_bytes = _parse_payload_bytes(payload)
+                    if raw_bytes is None:
+                        logger.debug("跳过无法解析的SSE数据块（非hex/base64或不完整）")
+                        continue
+                    try:
+                        event = parse_response_event(raw_bytes)
+                    except Exception as parse_error:
+                        logger.debug(f"解析事件失败，跳过: {str(parse_error)[:100]}")
+                        continue
+                    event_count += 1
                             
-                            event_type = _get_event_type(event_data)
-                            if show_all_events:
-                                all_events.append({"event_number": event_count, "event_type": event_type, "raw_data": event_data})
-                            logger.info(f"🔄 Event #{event_count}: {event_type}")
-                            if show_all_events:
-                                logger.info(f"   📋 Event data: {str(event_data)}...")
+                    event_type = get_event_type(event)
+                    if collect_parsed:
+                        event_data = _event_to_dict(event)
+                        append_event({"event_number": event_count, "event_type": event_type, "parsed_data": event_data})
+                    if verbose:
+                        logger.debug("🔄 Event #%d: %s", event_count, event_type)
+                        if collect_parsed:
+                            logger.debug("   📋 Event data: %s...", event_data)
+                        elif show_all_events:
+                            # 非解析模式下字典只为日志而构建
+                            logger.debug("   📋 Event data: %s...", _event_to_dict(event))
                             
-                            if "init" in event_data:
-                                init_data = event_data["init"]
-                                conversation_id = init_data.get("conversation_id", conversation_id)
-                                task_id = init_data.get("task_id", task_id)
-                                logger.info(f"会话初始化: {conversation_id}")
-                                client_actions = _get(event_data, "client_actions", "clientActions")
-                                if isinstance(client_actions, dict):
-                                    actions = _get(client_actions, "actions", "Actions") or []
-                                    for i, action in enumerate(actions):
-                                        logger.info(f"   🎯 Action #{i+1}: {list(action.keys())}")
-                                        append_data = _get(action, "append_to_message_content", "appendToMessageContent")
-                                        if isinstance(append_data, dict):
-                                            message = append_data.get("message", {})
-                                            agent_output = _get(message, "agent_output", "agentOutput") or {}
-                                            text_content = agent_output.get("text", "")
-                                            if text_content:
-                                                complete_response.append(text_content)
-                                                logger.info(f"   📝 Text Fragment: {text_content[:100]}...")
-                                        messages_data = _get(action, "add_messages_to_task", "addMessagesToTask")
-                                        if isinstance(messages_data, dict):
-                                            messages = messages_data.get("messages", [])
-                                            task_id = messages_data.get("task_id", messages_data.get("taskId", task_id))
-                                            for j, message in enumerate(messages):
-                                                logger.info(f"   📨 Message #{j+1}: {list(message.keys())}")
-                                                if _get(message, "agent_output", "agentOutput") is not None:
-                                                    agent_output = _get(message, "agent_output", "agentOutput") or {}
-                                                    text_content = agent_output.get("text", "")
-                                                    if text_content:
-                                                        complete_response.append(text_content)
-                                                        logger.info(f"   📝 Complete Message: {text_content[:100]}...")
+                    kind = event.WhichOneof("type")
+                    if kind == "init":
+                        conversation_id = event.init.conversation_id or conversation_id
+                        logger.info(f"会话初始化: {conversation_id}")
+                    elif kind == "client_actions":
+                        for i, action in enumerate(event.client_actions.actions):
+                            action_kind = action.WhichOneof("action")
+                            if verbose:
+                                logger.debug("   🎯 Action #%d: %s", i + 1, action_kind)
+                            if action_kind == "append_to_message_content":
+                                text_content = action.append_to_message_content.message.agent_output.text
+                                if text_content:
+                                    write_text(text_content)
+                                    if verbose:
+                                        logger.debug("   📝 Text Fragment: %s...", text_content[:100])
+                            elif action_kind == "add_messages_to_task":
+                                messages_data = action.add_messages_to_task
+                                task_id = messages_data.task_id or task_id
+                                for j, message in enumerate(messages_data.messages):
+                                    message_kind = message.WhichOneof("message")
+                                    if verbose:
+                                        logger.debug("   📨 Message #%d: %s", j + 1, message_kind)
+                                    if message_kind == "agent_output":
+                                        text_content = message.agent_output.text
+                                        if text_content:
+                                            write_text(text_content)
+                                            if verbose:
+                                                logger.debug("   📝 Complete Message: %s...", text_content[:100])
+                    # 长事件流中定期让出事件循环，避免饿死其他协程
+                    if event_count & 31 == 0:
+                        await asyncio.sleep(0)
                     
-                    full_response = "".join(complete_response)
-                    logger.info("="*60)
-                    logger.info("📊 SSE STREAM SUMMARY")
-                    logger.info("="*60)
-                    logger.info(f"📈 Total Events Processed: {event_count}")
-                    logger.info(f"🆔 Conversation ID: {conversation_id}")
-                    logger.info(f"🆔 Task ID: {task_id}")
-                    logger.info(f"📝 Response Length: {len(full_response)} characters")
-                    logger.info("="*60)
-                    if full_response:
-                        logger.info(f"✅ Stream processing completed successfully")
-                        return full_response, conversation_id, task_id
-                    else:
-                        logger.warning("⚠️ No text content received in response")
-                        return "Warning: No response content received", conversation_id, task_id
+                full_response = complete_response.getvalue()
+                if collect_parsed:
+                    logger.info(_SUMMARY_TMPL_PARSED, event_count, conversation_id, task_id, len(full_response), len(events))
+                else:
+                    logger.info(_SUMMARY_TMPL, event_count, conversation_id, task_id, len(full_response))
+                if full_response or collect_parsed:
+                    logger.info(f"✅ Stream processing completed successfully{mode}")
+                    return full_response, conversation_id, task_id, events
+                else:
+                    logger.warning("⚠️ No text content received in response")
+                    return "Warning: No response content received", conversation_id, task_id, events
     except Exception as e:
-        import traceback
         logger.error("="*60)
-        logger.error("WARP API CLIENT EXCEPTION")
+        logger.error(f"WARP API CLIENT EXCEPTION{mode}")
         logger.error("="*60)
         logger.error(f"Exception Type: {type(e).__name__}")
         logger.error(f"Exception Message: {str(e)}")
@@ -245,182 +424,16 @@ async def send_protobuf_to_warp_api(
         raise
 
 
+async def send_protobuf_to_warp_api(
+    protobuf_bytes: bytes, show_all_events: bool = True
+) -> tuple[str, Optional[str], Optional[str]]:
+    """发送protobuf数据到Warp API并获取响应"""
+    text, conversation_id, task_id, _ = await _stream_warp(
+        protobuf_bytes, show_all_events=show_all_events, collect_parsed=False
+    )
+    return text, conversation_id, task_id
+
+
 async def send_protobuf_to_warp_api_parsed(protobuf_bytes: bytes) -> tuple[str, Optional[str], Optional[str], list]:
     """发送protobuf数据到Warp API并获取解析后的SSE事件数据"""
-    try:
-        logger.info(f"发送 {len(protobuf_bytes)} 字节到Warp API (解析模式)")
-        logger.info(f"数据包前32字节 (hex): {protobuf_bytes[:32].hex()}")
-        
-        warp_url = CONFIG_WARP_URL
-        
-        logger.info(f"发送请求到: {warp_url}")
-        
-        conversation_id = None
-        task_id = None
-        complete_response = []
-        parsed_events = []
-        event_count = 0
-        
-        verify_opt = True
-        insecure_env = os.getenv("WARP_INSECURE_TLS", "").lower()
-        if insecure_env in ("1", "true", "yes"):
-            verify_opt = False
-            logger.warning("TLS verification disabled via WARP_INSECURE_TLS for Warp API client")
-
-        async with httpx.AsyncClient(http2=True, timeout=httpx.Timeout(60.0), verify=verify_opt, trust_env=True) as client:
-            # 最多尝试两次：第一次失败且为配额429时申请匿名token并重试一次
-            for attempt in range(2):
-                jwt = await get_valid_jwt() if attempt == 0 else jwt  # keep existing unless refreshed explicitly
-                headers = {
-                    "accept": "text/event-stream",
-                    "content-type": "application/x-protobuf", 
-                    "x-warp-client-version": "v0.2025.08.06.08.12.stable_02",
-                    "x-warp-os-category": "Windows",
-                    "x-warp-os-name": "Windows", 
-                    "x-warp-os-version": "11 (26100)",
-                    "authorization": f"Bearer {jwt}",
-                    "content-length": str(len(protobuf_bytes)),
-                }
-                async with client.stream("POST", warp_url, headers=headers, content=protobuf_bytes) as response:
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        error_content = error_text.decode('utf-8') if error_text else "No error content"
-                        # 检测配额耗尽错误并在第一次失败时尝试申请匿名token
-                        if response.status_code == 429 and attempt == 0 and (
-                            ("No remaining quota" in error_content) or ("No AI requests remaining" in error_content)
-                        ):
-                            logger.warning("WARP API 返回 429 (配额用尽, 解析模式)。尝试申请匿名token并重试一次…")
-                            try:
-                                new_jwt = await acquire_anonymous_access_token()
-                            except Exception:
-                                new_jwt = None
-                            if new_jwt:
-                                jwt = new_jwt
-                                # 跳出当前响应并进行下一次尝试
-                                continue
-                            else:
-                                logger.error("匿名token申请失败，无法重试 (解析模式)。")
-                                logger.error(f"WARP API HTTP ERROR (解析模式) {response.status_code}: {error_content}")
-                                return f"❌ Warp API Error (HTTP {response.status_code}): {error_content}", None, None, []
-                        # 其他错误或第二次失败
-                        logger.error(f"WARP API HTTP ERROR (解析模式) {response.status_code}: {error_content}")
-                        return f"❌ Warp API Error (HTTP {response.status_code}): {error_content}", None, None, []
-                    
-                    logger.info(f"✅ 收到HTTP {response.status_code}响应 (解析模式)")
-                    logger.info("开始处理SSE事件流...")
-                    
-                    import re as _re2
-                    def _parse_payload_bytes2(data_str: str):
-                        s = _re2.sub(r"\s+", "", data_str or "")
-                        if not s:
-                            return None
-                        if _re2.fullmatch(r"[0-9a-fA-F]+", s or ""):
-                            try:
-                                return bytes.fromhex(s)
-                            except Exception:
-                                pass
-                        pad = "=" * ((4 - (len(s) % 4)) % 4)
-                        try:
-                            import base64 as _b642
-                            return _b642.urlsafe_b64decode(s + pad)
-                        except Exception:
-                            try:
-                                return _b642.b64decode(s + pad)
-                            except Exception:
-                                return None
-                    
-                    current_data = ""
-                    
-                    async for line in response.aiter_lines():
-                        if line.startswith("data:"):
-                            payload = line[5:].strip()
-                            if not payload:
-                                continue
-                            if payload == "[DONE]":
-                                logger.info("收到[DONE]标记，结束处理")
-                                break
-                            current_data += payload
-                            continue
-                        
-                        if (line.strip() == "") and current_data:
-                            raw_bytes = _parse_payload_bytes2(current_data)
-                            current_data = ""
-                            if raw_bytes is None:
-                                logger.debug("跳过无法解析的SSE数据块（非hex/base64或不完整）")
-                                continue
-                            try:
-                                event_data = protobuf_to_dict(raw_bytes, "warp.multi_agent.v1.ResponseEvent")
-                                event_count += 1
-                                event_type = _get_event_type(event_data)
-                                parsed_event = {"event_number": event_count, "event_type": event_type, "parsed_data": event_data}
-                                parsed_events.append(parsed_event)
-                                logger.info(f"🔄 Event #{event_count}: {event_type}")
-                                logger.debug(f"   📋 Event data: {str(event_data)}...")
-                                
-                                def _get(d: Dict[str, Any], *names: str) -> Any:
-                                    for n in names:
-                                        if isinstance(d, dict) and n in d:
-                                            return d[n]
-                                    return None
-                                
-                                if "init" in event_data:
-                                    init_data = event_data["init"]
-                                    conversation_id = init_data.get("conversation_id", conversation_id)
-                                    task_id = init_data.get("task_id", task_id)
-                                    logger.info(f"会话初始化: {conversation_id}")
-                                
-                                client_actions = _get(event_data, "client_actions", "clientActions")
-                                if isinstance(client_actions, dict):
-                                    actions = _get(client_actions, "actions", "Actions") or []
-                                    for i, action in enumerate(actions):
-                                        logger.info(f"   🎯 Action #{i+1}: {list(action.keys())}")
-                                        append_data = _get(action, "append_to_message_content", "appendToMessageContent")
-                                        if isinstance(append_data, dict):
-                                            message = append_data.get("message", {})
-                                            agent_output = _get(message, "agent_output", "agentOutput") or {}
-                                            text_content = agent_output.get("text", "")
-                                            if text_content:
-                                                complete_response.append(text_content)
-                                                logger.info(f"   📝 Text Fragment: {text_content[:100]}...")
-                                        messages_data = _get(action, "add_messages_to_task", "addMessagesToTask")
-                                        if isinstance(messages_data, dict):
-                                            messages = messages_data.get("messages", [])
-                                            task_id = messages_data.get("task_id", messages_data.get("taskId", task_id))
-                                            for j, message in enumerate(messages):
-                                                logger.info(f"   📨 Message #{j+1}: {list(message.keys())}")
-                                                if _get(message, "agent_output", "agentOutput") is not None:
-                                                    agent_output = _get(message, "agent_output", "agentOutput") or {}
-                                                    text_content = agent_output.get("text", "")
-                                                    if text_content:
-                                                        complete_response.append(text_content)
-                                                        logger.info(f"   📝 Complete Message: {text_content[:100]}...")
-                            except Exception as parse_err:
-                                logger.debug(f"解析事件失败，跳过: {str(parse_err)[:100]}")
-                                continue
-                    
-                    full_response = "".join(complete_response)
-                    logger.info("="*60)
-                    logger.info("📊 SSE STREAM SUMMARY (解析模式)")
-                    logger.info("="*60)
-                    logger.info(f"📈 Total Events Processed: {event_count}")
-                    logger.info(f"🆔 Conversation ID: {conversation_id}")
-                    logger.info(f"🆔 Task ID: {task_id}")
-                    logger.info(f"📝 Response Length: {len(full_response)} characters")
-                    logger.info(f"🎯 Parsed Events Count: {len(parsed_events)}")
-                    logger.info("="*60)
-                    
-                    logger.info(f"✅ Stream processing completed successfully (解析模式)")
-                    return full_response, conversation_id, task_id, parsed_events
-    except Exception as e:
-        import traceback
-        logger.error("="*60)
-        logger.error("WARP API CLIENT EXCEPTION (解析模式)")
-        logger.error("="*60)
-        logger.error(f"Exception Type: {type(e).__name__}")
-        logger.error(f"Exception Message: {str(e)}")
-        logger.error(f"Request URL: {warp_url if 'warp_url' in locals() else 'Unknown'}")
-        logger.error(f"Request Size: {len(protobuf_bytes) if 'protobuf_bytes' in locals() else 'Unknown'}")
-        logger.error("Python Traceback:")
-        logger.error(traceback.format_exc())
-        logger.error("="*60)
-        raise
\ No newline at end of file
+    return await _stream_warp(protobuf_bytes, show_all_events=False, collect_parsed=True)